@@ -3,6 +3,12 @@ import selectors
 import time
 import sys
 import os
+import math
+import re
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Context, Decimal
 
 sel = selectors.DefaultSelector()
 dictionary = {}
@@ -14,11 +20,49 @@ lists = {}
 list_blocking_clients = {}
 subscriptions = {}
 
+# Client ids and negotiated RESP version (HELLO), keyed by connection
+client_ids = {}
+clients_by_id = {}
+client_protocol = {}
+next_client_id = 1
+
+# Client-side caching (CLIENT TRACKING)
+tracking_clients = {}   # conn -> {"bcast": bool, "prefixes": [...], "redirect": id or None,
+                        #          "keys": keys this client has in tracking_table}
+tracking_table = {}     # key -> set of client ids that read it
+tracking_prefixes = {}  # BCAST prefix -> set of client ids
+current_client = None   # connection whose command is executing
+
+# Per-connection RequestReader holding partially received commands
+request_readers = {}
+
+# Reply fragments not yet written to each client, and clients with new output
+pending_output = {}
+clients_pending_write = set()
+
 config = {
     'dir': '/tmp',
-    'dbfilename': 'dump.rdb'
+    'dbfilename': 'dump.rdb',
+    'io-threads': 1,
+    'tracking-table-max-keys': 1000000,
+    'lazyfree-lazy-expire': 'no',
+    'lazyfree-lazy-server-del': 'no',
+    'lazyfree-lazy-user-del': 'no',
+    'lazyfree-lazy-user-flush': 'no',
 }
 
+# Threads for socket reads/parsing and writes, created when io-threads > 1.
+# Command execution stays on the main thread, so on a regular (GIL) CPython
+# build this costs more in hand-offs than it saves; it only pays off on a
+# free-threaded build with spare cores. Keep the default of 1 otherwise.
+io_pool = None
+
+# Values with more elements than this are released by the lazyfree thread
+LAZYFREE_THRESHOLD = 64
+# Elements the lazyfree thread releases before giving the GIL back
+LAZYFREE_CHUNK = 1024
+lazyfree_queue = queue.Queue()
+
 
 def load_rdb():
     """Load RDB keys, values, and expirations."""
@@ -116,13 +160,222 @@ def parse_resp_array(data):
     return args
 
 
+class RequestReader:
+    """Incremental RESP parser for one connection's input stream.
+
+    Keeps a partially received command across reads, so large commands
+    (e.g. an MSET of many keys) and pipelined commands are framed correctly.
+    Parsing resumes where the previous read stopped instead of rescanning.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.start = 0       # offset of the command being parsed
+        self.cursor = 0      # parse position within buffer
+        self.count = None    # argument count of the current command
+        self.offsets = []    # argument (start, end) relative to self.start
+
+    def feed(self, data):
+        """Add received bytes; returns a list of (data, cmd, args) commands."""
+        self.buffer += data
+        requests = []
+        while True:
+            request = self.parse_command()
+            if request is None:
+                break
+            requests.append(request)
+        if self.start:
+            del self.buffer[:self.start]
+            self.cursor -= self.start
+            self.start = 0
+        return requests
+
+    def parse_command(self):
+        buf = self.buffer
+        while self.count is None:
+            if self.cursor >= len(buf):
+                return None
+            if buf[self.cursor] != ord("*"):
+                # Inline command: one line at a time, split on whitespace
+                end = buf.find(b"\n", self.cursor)
+                if end == -1:
+                    return None
+                data = bytes(buf[self.start:end + 1])
+                self.start = self.cursor = end + 1
+                args = data.split()
+                if not args:
+                    continue
+                return data, data.upper(), args
+            end = buf.find(b"\r\n", self.cursor)
+            if end == -1:
+                return None
+            self.count = int(buf[self.cursor + 1:end])
+            self.cursor = end + 2
+
+        while len(self.offsets) < self.count:
+            end = buf.find(b"\r\n", self.cursor)
+            if end == -1:
+                return None
+            length = int(buf[self.cursor + 1:end])
+            arg_start = end + 2
+            if arg_start + length + 2 > len(buf):
+                return None
+            self.offsets.append((arg_start - self.start, arg_start + length - self.start))
+            self.cursor = arg_start + length + 2
+
+        data = bytes(buf[self.start:self.cursor])
+        args = [data[start:end] for start, end in self.offsets]
+        self.start = self.cursor
+        self.count = None
+        self.offsets = []
+        return data, data.upper(), args
+
+
+# "$<len>\r\n" / "*<len>\r\n" headers for common sizes are built once, so reply
+# paths don't format a length for every element.
+SHARED_HDR_LEN = 512
+bulk_headers = [b"$%d\r\n" % n for n in range(SHARED_HDR_LEN)]
+array_headers = [b"*%d\r\n" % n for n in range(SHARED_HDR_LEN)]
+
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+def bulk_header(length):
+    if length < SHARED_HDR_LEN:
+        return bulk_headers[length]
+    return b"$%d\r\n" % length
+
+
+def array_header(length):
+    if length < SHARED_HDR_LEN:
+        return array_headers[length]
+    return b"*%d\r\n" % length
+
+
 def string(words):
-    return b"$" + str(len(words)).encode() + b"\r\n" + words + b"\r\n"
+    return b"".join((bulk_header(len(words)), words, b"\r\n"))
+
+
+class Reply:
+    """RESP reply kept as a list of fragments instead of one growing bytes.
+
+    Stored values are appended by reference, so building a reply never copies
+    value data; write_pending() hands the fragments to sendmsg() in one go.
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def array(self, length):
+        self.parts.append(array_header(length))
+        return self
+
+    def bulk(self, value):
+        self.parts += (bulk_header(len(value)), value, b"\r\n")
+        return self
+
+    def raw(self, data):
+        self.parts.append(data)
+        return self
+
+    def extend(self, reply):
+        if isinstance(reply, Reply):
+            self.parts += reply.parts
+        else:
+            self.parts.append(reply)
+        return self
+
+    def __bytes__(self):
+        return b"".join(self.parts)
+
+
+def queue_reply(conn, reply):
+    """Append a bytes or Reply object to conn's pending output.
+
+    Nothing is written here; handle_pending_writes() flushes every client
+    with new output once per event loop iteration.
+    """
+    if reply is None:
+        return
+    output = pending_output.setdefault(conn, [])
+    if isinstance(reply, Reply):
+        output += reply.parts
+    else:
+        output.append(reply)
+    clients_pending_write.add(conn)
+
+
+def write_pending(conn):
+    """Write as much pending output as the socket accepts without blocking.
+
+    Returns True once everything is written. Raises OSError for a broken
+    connection. Only touches the socket, so it is safe on an I/O thread.
+    """
+    parts = pending_output.get(conn)
+    if not parts:
+        return True
+    i = 0
+    try:
+        while i < len(parts):
+            batch = parts[i:i + IOV_MAX]
+            try:
+                if HAVE_SENDMSG:
+                    sent = conn.sendmsg(batch)
+                else:
+                    sent = conn.send(b"".join(batch))
+            except BlockingIOError:
+                break
+            # Drop fully written fragments, resume a partial one through a view
+            for part in batch:
+                length = len(part)
+                if sent >= length:
+                    sent -= length
+                    i += 1
+                else:
+                    if sent:
+                        parts[i] = memoryview(part)[sent:]
+                    break
+            else:
+                continue
+            break  # The socket buffer is full
+    finally:
+        del parts[:i]
+    return not parts
+
+
+def finish_write(conn, done):
+    """Watch conn for EVENT_WRITE while it still has unsent output."""
+    if done:
+        pending_output.pop(conn, None)
+        events = selectors.EVENT_READ
+    else:
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE
+    if sel.get_key(conn).events != events:
+        sel.modify(conn, events, read)
+
+
+def flush_output(conn):
+    clients_pending_write.discard(conn)
+    try:
+        done = write_pending(conn)
+    except OSError:
+        close_client(conn)
+        return
+    finish_write(conn, done)
 
 
 def accept(sock):
+    global next_client_id
     conn, _ = sock.accept()
     conn.setblocking(False)
+    client_ids[conn] = next_client_id
+    clients_by_id[next_client_id] = conn
+    next_client_id += 1
+    request_readers[conn] = RequestReader()
     sel.register(conn, selectors.EVENT_READ, read)
 
 
@@ -167,19 +420,23 @@ def compare_ids(id1, id2):
 
 
 
+def add_stream_entries(reply, entries):
+    reply.array(len(entries))
+    for entry in entries:
+        reply.array(2).bulk(entry["id"])
+        fields = entry["fields"]
+        reply.array(len(fields) * 2)
+        for f, v in fields.items():
+            reply.bulk(f).bulk(v)
+
+
 def build_xread_response(stream_keys, resolved_ids):
-    result = b"*" + str(len(stream_keys)).encode() + b"\r\n"
+    reply = Reply().array(len(stream_keys))
     for stream_key, last_id in zip(stream_keys, resolved_ids):
         new_entries = [e for e in streams.get(stream_key, []) if compare_ids(e["id"], last_id) > 0]
-        result += b"*2\r\n" + string(stream_key)
-        result += b"*" + str(len(new_entries)).encode() + b"\r\n"
-        for entry in new_entries:
-            result += b"*2\r\n" + string(entry["id"])
-            fields = entry["fields"]
-            result += b"*" + str(len(fields) * 2).encode() + b"\r\n"
-            for f, v in fields.items():
-                result += string(f) + string(v)
-    return result
+        reply.array(2).bulk(stream_key)
+        add_stream_entries(reply, new_entries)
+    return reply
 
 
 def notify_blocked_clients(stream_key):
@@ -201,12 +458,8 @@ def notify_blocked_clients(stream_key):
             if has_new_entries:
                 # Send response to blocked client
                 response = build_xread_response(stream_keys, resolved_ids)
-                try:
-                    conn.sendall(response)
-                    clients_to_remove.append(conn)
-                except:
-                    # Connection might be closed
-                    clients_to_remove.append(conn)
+                queue_reply(conn, response)
+                clients_to_remove.append(conn)
     
     # Remove notified clients from blocking list
     for conn in clients_to_remove:
@@ -218,6 +471,8 @@ def execute_xrange_command(data):
     stream_key = parts[4]
     start_id = parts[6]
     end_id = parts[8]
+    expire_if_needed(stream_key)
+    track_key(stream_key)
     if stream_key not in streams:
         return b"*0\r\n"
 
@@ -230,14 +485,9 @@ def execute_xrange_command(data):
             continue
         entries.append(entry)
 
-    result = b"*" + str(len(entries)).encode() + b"\r\n"
-    for entry in entries:
-        result += b"*2\r\n" + string(entry["id"])
-        fields = entry["fields"]
-        result += b"*" + str(len(fields) * 2).encode() + b"\r\n"
-        for f, v in fields.items():
-            result += string(f) + string(v)
-    return result
+    reply = Reply()
+    add_stream_entries(reply, entries)
+    return reply
 
 
 def execute_xread_command(data, conn):
@@ -272,6 +522,8 @@ def execute_xread_command(data, conn):
 
     resolved_ids = []
     for k, sid in zip(stream_keys, stream_ids):
+        expire_if_needed(k)
+        track_key(k)
         if sid == b"$":
             resolved_ids.append(get_max_id_in_stream(k))
         else:
@@ -304,6 +556,7 @@ def execute_xadd_command(data):
     
     stream_key = args[1]
     raw_id = args[2]
+    expire_if_needed(stream_key)
 
     # Generate entry ID
     if raw_id == b"*":
@@ -339,6 +592,7 @@ def execute_xadd_command(data):
 
     entry = {"id": entry_id, "fields": fields}
     streams[stream_key].append(entry)
+    invalidate_key(stream_key)
 
     notify_blocked_clients(stream_key)
 
@@ -356,11 +610,9 @@ def notify_blpop_clients(key):
     for conn, info in sorted(list_blocking_clients.items(), key=lambda x: x[1]["start_time"]):
         if info["key"] == key and key in lists and len(lists[key]) > 0:
             value = lists[key].pop(0)
+            invalidate_key(key)
             resp = b"*2\r\n" + string(key) + string(value)
-            try:
-                conn.sendall(resp)
-            except:
-                pass
+            queue_reply(conn, resp)
             to_remove.append(conn)
             break  # Serve one client only (FIFO)
 
@@ -373,64 +625,733 @@ def enqueue(conn, cmd, data):
     transactions[conn]["queue"].append((cmd, data))
 
 
+def send_invalidation(client_id, keys):
+    """Push an invalidate message for keys (None = everything) to a client."""
+    conn = clients_by_id.get(client_id)
+    info = tracking_clients.get(conn)
+    if info is None:
+        return
+    if keys is None:
+        info["keys"].clear()
+    else:
+        info["keys"].difference_update(keys)
+    target = conn
+    if info["redirect"] is not None:
+        target = clients_by_id.get(info["redirect"])
+    elif client_protocol.get(conn, 2) != 3:
+        return  # RESP2 clients only get invalidations through REDIRECT
+    if target is None:
+        return  # REDIRECT target gone; no tracking-redir-broken push is sent
+
+    reply = Reply()
+    if client_protocol.get(target, 2) == 3:
+        reply.raw(b">2\r\n").bulk(b"invalidate")
+    elif b"__redis__:invalidate" in subscriptions.get(target, ()):
+        reply.array(3).bulk(b"message").bulk(b"__redis__:invalidate")
+    else:
+        return  # a RESP2 target only reads it as a pub/sub message
+    if keys is None:
+        reply.raw(b"*-1\r\n")
+    else:
+        reply.array(len(keys))
+        for key in keys:
+            reply.bulk(key)
+    # Goes after any reply already produced for target, never ahead of it
+    queue_reply(target, reply)
+
+
+def track_key(key):
+    """Remember that the current client read key (default tracking mode)."""
+    info = tracking_clients.get(current_client)
+    if info is None or info["bcast"]:
+        return
+    readers = tracking_table.get(key)
+    if readers is None:
+        # Bound the table: forget the oldest key, telling its readers to drop it
+        while tracking_table and len(tracking_table) >= config['tracking-table-max-keys']:
+            old_key = next(iter(tracking_table))
+            for client_id in tracking_table.pop(old_key):
+                send_invalidation(client_id, [old_key])
+        readers = tracking_table[key] = set()
+    readers.add(client_ids[current_client])
+    info["keys"].add(key)
+
+
+def invalidate_key(key):
+    """Called from every write path: notify clients caching key."""
+    notified = tracking_table.pop(key, set())
+    for client_id in notified:
+        send_invalidation(client_id, [key])
+    for prefix, client_ids_for_prefix in tracking_prefixes.items():
+        if key.startswith(prefix):
+            for client_id in client_ids_for_prefix - notified:
+                send_invalidation(client_id, [key])
+                notified.add(client_id)
+
+
+def disable_tracking(conn):
+    info = tracking_clients.pop(conn, None)
+    if info is None:
+        return
+    client_id = client_ids[conn]
+    # Drop the client from keys it read, so a later session starts clean
+    # and its old reads stop counting toward tracking-table-max-keys
+    for key in info["keys"]:
+        readers = tracking_table.get(key)
+        if readers is not None:
+            readers.discard(client_id)
+            if not readers:
+                del tracking_table[key]
+    for prefix in info["prefixes"]:
+        ids = tracking_prefixes.get(prefix)
+        if ids is not None:
+            ids.discard(client_id)
+            if not ids:
+                del tracking_prefixes[prefix]
+
+
+def release_in_chunks(value):
+    """Empty a detached list or dict a chunk at a time.
+
+    A single clear() frees every element in one C call without dropping the
+    GIL, which stalls the event loop as badly as freeing it inline; sleeping
+    between chunks hands the GIL back to the main thread.
+    """
+    if isinstance(value, dict):
+        while value:
+            for _ in range(min(LAZYFREE_CHUNK, len(value))):
+                _, item = value.popitem()
+                # A flushed keyspace holds whole lists and streams
+                if isinstance(item, list) and len(item) > LAZYFREE_CHUNK:
+                    release_in_chunks(item)
+            del item
+            time.sleep(0)
+    else:
+        while value:
+            del value[-LAZYFREE_CHUNK:]
+            time.sleep(0)
+
+
+def lazyfree_worker():
+    """Background reclaim thread: releases values detached from the keyspace."""
+    while True:
+        value = lazyfree_queue.get()
+        release_in_chunks(value)
+        del value
+
+
+def free_value(value, lazy):
+    # Strings cost one free; only containers are worth handing off
+    if lazy and not isinstance(value, bytes) and len(value) > LAZYFREE_THRESHOLD:
+        lazyfree_queue.put(value)
+
+
+def delete_key(key, lazy=False):
+    """Remove key from the keyspace; returns True if it existed.
+
+    With lazy set, big lists and streams are only unlinked here (O(1)) and
+    released later by lazyfree_worker.
+    """
+    found = False
+    for keyspace in (dictionary, lists, streams):
+        value = keyspace.pop(key, None)
+        if value is not None:
+            found = True
+            free_value(value, lazy)
+    expiration_times.pop(key, None)
+    if found:
+        invalidate_key(key)
+    return found
+
+
+def flush_all(lazy):
+    global dictionary, lists, streams, expiration_times
+    old_keyspaces = (dictionary, lists, streams, expiration_times)
+    dictionary, lists, streams, expiration_times = {}, {}, {}, {}
+
+    tracking_table.clear()
+    for conn in list(tracking_clients):
+        send_invalidation(client_ids[conn], None)
+
+    if lazy:
+        for keyspace in old_keyspaces:
+            lazyfree_queue.put(keyspace)
+
+
+def expire_if_needed(key):
+    """Delete key if its TTL has passed; returns True when it was expired."""
+    if key in expiration_times and time.time() >= expiration_times[key]:
+        delete_key(key, config['lazyfree-lazy-expire'] == 'yes')
+        return True
+    return False
+
+
+def execute_del_command(args, lazy=None):
+    if len(args) < 2:
+        return b"-ERR wrong number of arguments\r\n"
+    if lazy is None:
+        lazy = config['lazyfree-lazy-user-del'] == 'yes'
+    deleted = 0
+    for key in args[1:]:
+        # A key past its TTL is already gone, even if not yet reclaimed
+        expire_if_needed(key)
+        if delete_key(key, lazy):
+            deleted += 1
+    return b":%d\r\n" % deleted
+
+
+def execute_unlink_command(args):
+    return execute_del_command(args, True)
+
+
+def execute_flush_command(args):
+    lazy = config['lazyfree-lazy-user-flush'] == 'yes'
+    if len(args) > 2:
+        return b"-ERR syntax error\r\n"
+    if len(args) == 2:
+        mode = args[1].upper()
+        if mode == b"ASYNC":
+            lazy = True
+        elif mode == b"SYNC":
+            lazy = False
+        else:
+            return b"-ERR syntax error\r\n"
+    flush_all(lazy)
+    return b"+OK\r\n"
+
+
+def execute_hello_command(args, conn):
+    protocol = client_protocol.get(conn, 2)
+    if len(args) > 1:
+        try:
+            protocol = int(args[1])
+        except ValueError:
+            return b"-ERR Protocol version is not an integer or out of range\r\n"
+        if protocol not in (2, 3):
+            return b"-NOPROTO unsupported protocol version\r\n"
+    client_protocol[conn] = protocol
+
+    fields = [
+        (b"server", string(b"redis")),
+        (b"version", string(b"7.0.0")),
+        (b"proto", b":%d\r\n" % protocol),
+        (b"id", b":%d\r\n" % client_ids[conn]),
+        (b"mode", string(b"standalone")),
+        (b"role", string(b"master")),
+        (b"modules", b"*0\r\n"),
+    ]
+    reply = Reply()
+    if protocol == 3:
+        reply.raw(b"%%%d\r\n" % len(fields))
+    else:
+        reply.array(len(fields) * 2)
+    for name, value in fields:
+        reply.bulk(name).raw(value)
+    return reply
+
+
+def execute_client_tracking_command(args, conn):
+    if len(args) < 3 or args[2].upper() not in (b"ON", b"OFF"):
+        return b"-ERR syntax error\r\n"
+    if args[2].upper() == b"OFF":
+        disable_tracking(conn)
+        return b"+OK\r\n"
+
+    bcast = False
+    prefixes = []
+    redirect = None
+    i = 3
+    while i < len(args):
+        option = args[i].upper()
+        if option == b"BCAST":
+            bcast = True
+            i += 1
+        elif option == b"PREFIX" and i + 1 < len(args):
+            prefixes.append(args[i + 1])
+            i += 2
+        elif option == b"REDIRECT" and i + 1 < len(args):
+            try:
+                redirect = int(args[i + 1])
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+            if redirect not in clients_by_id:
+                return b"-ERR The client ID you want redirect to does not exist\r\n"
+            i += 2
+        else:
+            return b"-ERR syntax error\r\n"
+    if prefixes and not bcast:
+        return b"-ERR PREFIX option requires BCAST mode to be enabled\r\n"
+    if bcast and not prefixes:
+        prefixes = [b""]
+
+    disable_tracking(conn)
+    tracking_clients[conn] = {
+        "bcast": bcast, "prefixes": prefixes, "redirect": redirect, "keys": set(),
+    }
+    for prefix in prefixes:
+        tracking_prefixes.setdefault(prefix, set()).add(client_ids[conn])
+    return b"+OK\r\n"
+
+
+def execute_client_command(args, conn):
+    if len(args) < 2:
+        return b"-ERR wrong number of arguments for 'client' command\r\n"
+    subcommand = args[1].upper()
+    if subcommand == b"ID":
+        return b":%d\r\n" % client_ids[conn]
+    elif subcommand == b"TRACKING":
+        return execute_client_tracking_command(args, conn)
+    return b"-ERR unknown subcommand\r\n"
+
+
 def execute_keys_command(_):
-    keys = list(dictionary.keys())
-    result = b"*" + str(len(keys)).encode() + b"\r\n"
-    for key in keys:
-        result += string(key)
-    return result
+    reply = Reply().array(len(dictionary))
+    for key in dictionary:
+        reply.bulk(key)
+    return reply
 
 
-def execute_set_command(data):
-    global dictionary, expiration_times
-    split = data.split(b"\r\n")
-    key = split[4]
-    value = split[6]
+def parse_int(raw):
+    """Strict 64-bit integer parse of a RESP argument; None on error."""
+    if not (raw.isdigit() or (raw[:1] == b"-" and raw[1:].isdigit())):
+        return None
+    value = int(raw)
+    if not -2**63 <= value < 2**63:
+        return None
+    return value
+
+
+WRONGTYPE = b"-WRONGTYPE Operation against a key holding the wrong kind of value\r\n"
+
+
+# Plain decimal floats only: no "_" separators, whitespace, inf or nan
+FLOAT_PATTERN = re.compile(rb"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+FLOAT_CONTEXT = Context(prec=400)  # enough digits for any double at 17 places
+
+
+def parse_float(raw):
+    if not FLOAT_PATTERN.fullmatch(raw):
+        return None
+    return float(raw)
+
+
+def format_float(value):
+    """Fixed-point text with at most 17 decimals and no trailing zeros.
+
+    Mirrors Redis's "%.17Lf" output, but starts from the shortest repr of
+    the double so 10.5 + 0.1 prints as 10.6 rather than 10.59999999999999964.
+    """
+    text = "{:f}".format(Decimal(repr(value)).quantize(Decimal("1e-17"), context=FLOAT_CONTEXT))
+    return text.rstrip("0").rstrip(".").encode()
+
+
+def lookup_key_read(key):
+    # Expire before tracking: expiring invalidates, which would drop the entry
+    value = lookup_key_write(key)
+    track_key(key)
+    return value
+
+
+def lookup_key_write(key):
+    """String value of key, None if missing, or WRONGTYPE for a list/stream."""
+    expire_if_needed(key)
+    if key in lists or key in streams:
+        return WRONGTYPE
+    return dictionary.get(key)
+
+
+def key_exists(key):
+    expire_if_needed(key)
+    return key in dictionary or key in lists or key in streams
+
+
+def set_string(key, value, keep_ttl=False, expire_at=None):
+    if key in lists or key in streams:
+        delete_key(key, config['lazyfree-lazy-server-del'] == 'yes')
     dictionary[key] = value
-    if len(split) > 10 and split[10].isdigit():
-        expiration_times[key] = time.time() + int(split[10]) / 1000
-    elif key in expiration_times:
-        del expiration_times[key]
+    if expire_at is not None:
+        expiration_times[key] = expire_at
+    elif not keep_ttl:
+        expiration_times.pop(key, None)
+    invalidate_key(key)
+
+
+def parse_expire_time(unit, raw):
+    """Turn an EX/PX/EXAT/PXAT argument into an absolute time in seconds."""
+    amount = parse_int(raw)
+    if amount is None:
+        return None, b"-ERR value is not an integer or out of range\r\n"
+    if amount <= 0:
+        return None, b"-ERR invalid expire time\r\n"
+    if unit == b"EX":
+        return time.time() + amount, None
+    elif unit == b"PX":
+        return time.time() + amount / 1000, None
+    elif unit == b"EXAT":
+        return float(amount), None
+    return amount / 1000, None
+
+
+def set_expire(key, when):
+    """Give key a TTL; a time already past deletes it. Both count as writes."""
+    if when <= time.time():
+        delete_key(key, config['lazyfree-lazy-expire'] == 'yes')
+    else:
+        expiration_times[key] = when
+        invalidate_key(key)
+
+
+def remove_expire(key):
+    if expiration_times.pop(key, None) is None:
+        return False
+    invalidate_key(key)
+    return True
+
+
+def execute_set_command(args):
+    if len(args) < 3:
+        return b"-ERR wrong number of arguments\r\n"
+    key, value = args[1], args[2]
+    condition = None
+    expire_at = None
+    keep_ttl = False
+    get = False
+
+    i = 3
+    while i < len(args):
+        option = args[i].upper()
+        if option in (b"NX", b"XX") and condition is None:
+            condition = option
+        elif option == b"GET":
+            get = True
+        elif option == b"KEEPTTL" and expire_at is None:
+            keep_ttl = True
+        elif option in (b"EX", b"PX", b"EXAT", b"PXAT") and expire_at is None \
+                and not keep_ttl and i + 1 < len(args):
+            expire_at, error = parse_expire_time(option, args[i + 1])
+            if error:
+                return error
+            i += 1
+        else:
+            return b"-ERR syntax error\r\n"
+        i += 1
+
+    # Plain SET overwrites any type; only SET ... GET cares about the old one
+    old_value = lookup_key_write(key)
+    if old_value is WRONGTYPE and get:
+        return WRONGTYPE
+    exists = old_value is not None
+    if (condition == b"NX" and exists) or (condition == b"XX" and not exists):
+        if get and old_value is not None:
+            return string(old_value)
+        return b"$-1\r\n"
+
+    set_string(key, value, keep_ttl, expire_at)
+    if get:
+        return b"$-1\r\n" if old_value is None else string(old_value)
     return b"+OK\r\n"
 
 
-def execute_get_command(data):
-    global dictionary, expiration_times
-    split = data.split(b"\r\n")
-    key = split[4]
-    if key not in dictionary:
+def execute_get_command(args):
+    if len(args) != 2:
+        return b"-ERR wrong number of arguments\r\n"
+    value = lookup_key_read(args[1])
+    if value is None:
         return b"$-1\r\n"
-    if key in expiration_times and time.time() >= expiration_times[key]:
-        del dictionary[key]
-        del expiration_times[key]
+    if value is WRONGTYPE:
+        return value
+    return string(value)
+
+
+def execute_mget_command(args):
+    if len(args) < 2:
+        return b"-ERR wrong number of arguments\r\n"
+    reply = Reply().array(len(args) - 1)
+    for key in args[1:]:
+        value = lookup_key_read(key)
+        if value is None or value is WRONGTYPE:
+            reply.raw(b"$-1\r\n")
+        else:
+            reply.bulk(value)
+    return reply
+
+
+def execute_mset_command(args):
+    if len(args) < 3 or len(args) % 2 == 0:
+        return b"-ERR wrong number of arguments\r\n"
+    for i in range(1, len(args), 2):
+        set_string(args[i], args[i + 1])
+    return b"+OK\r\n"
+
+
+def execute_msetnx_command(args):
+    if len(args) < 3 or len(args) % 2 == 0:
+        return b"-ERR wrong number of arguments\r\n"
+    for i in range(1, len(args), 2):
+        if key_exists(args[i]):
+            return b":0\r\n"
+    for i in range(1, len(args), 2):
+        set_string(args[i], args[i + 1])
+    return b":1\r\n"
+
+
+def execute_getex_command(args):
+    if len(args) < 2:
+        return b"-ERR wrong number of arguments\r\n"
+    key = args[1]
+    expire_at = None
+    persist = False
+    if len(args) > 2:
+        option = args[2].upper()
+        if option == b"PERSIST" and len(args) == 3:
+            persist = True
+        elif option in (b"EX", b"PX", b"EXAT", b"PXAT") and len(args) == 4:
+            expire_at, error = parse_expire_time(option, args[3])
+            if error:
+                return error
+        else:
+            return b"-ERR syntax error\r\n"
+
+    value = lookup_key_read(key)
+    if value is None:
         return b"$-1\r\n"
-    return string(dictionary[key])
+    if value is WRONGTYPE:
+        return value
+    if expire_at is not None:
+        set_expire(key, expire_at)
+    elif persist:
+        remove_expire(key)
+    return string(value)
 
 
-def execute_incr_command(data):
-    global dictionary, expiration_times
-    split = data.split(b"\r\n")
-    key = split[4]
-    if key in expiration_times and time.time() >= expiration_times[key]:
-        del dictionary[key]
-        del expiration_times[key]
-    if key in dictionary:
-        try:
-            current_value = int(dictionary[key])
-            new_value = current_value + 1
-            dictionary[key] = str(new_value).encode()
-            return b":" + str(new_value).encode() + b"\r\n"
-        except ValueError:
-            return b"-ERR value is not an integer or out of range\r\n"
-    dictionary[key] = b"1"
+def execute_getdel_command(args):
+    if len(args) != 2:
+        return b"-ERR wrong number of arguments\r\n"
+    value = lookup_key_read(args[1])
+    if value is None:
+        return b"$-1\r\n"
+    if value is WRONGTYPE:
+        return value
+    delete_key(args[1])
+    return string(value)
+
+
+def incr_by(key, delta):
+    value = lookup_key_write(key)
+    if value is WRONGTYPE:
+        return value
+    current = 0 if value is None else parse_int(value)
+    if current is None:
+        return b"-ERR value is not an integer or out of range\r\n"
+    new_value = current + delta
+    if not -2**63 <= new_value < 2**63:
+        return b"-ERR increment or decrement would overflow\r\n"
+    set_string(key, b"%d" % new_value, keep_ttl=True)
+    return b":%d\r\n" % new_value
+
+
+def execute_incr_command(args):
+    if len(args) != 2:
+        return b"-ERR wrong number of arguments\r\n"
+    return incr_by(args[1], 1)
+
+
+def execute_decr_command(args):
+    if len(args) != 2:
+        return b"-ERR wrong number of arguments\r\n"
+    return incr_by(args[1], -1)
+
+
+def execute_incrby_command(args, sign=1):
+    if len(args) != 3:
+        return b"-ERR wrong number of arguments\r\n"
+    delta = parse_int(args[2])
+    if delta is None:
+        return b"-ERR value is not an integer or out of range\r\n"
+    return incr_by(args[1], sign * delta)
+
+
+def execute_decrby_command(args):
+    return execute_incrby_command(args, -1)
+
+
+def execute_incrbyfloat_command(args):
+    if len(args) != 3:
+        return b"-ERR wrong number of arguments\r\n"
+    value = lookup_key_write(args[1])
+    if value is WRONGTYPE:
+        return value
+    current = 0.0 if value is None else parse_float(value)
+    delta = parse_float(args[2])
+    if current is None or delta is None:
+        return b"-ERR value is not a valid float\r\n"
+    new_value = current + delta
+    if math.isnan(new_value) or math.isinf(new_value):
+        return b"-ERR increment would produce NaN or Infinity\r\n"
+    encoded = format_float(new_value)
+    set_string(args[1], encoded, keep_ttl=True)
+    return string(encoded)
+
+
+def execute_append_command(args):
+    if len(args) != 3:
+        return b"-ERR wrong number of arguments\r\n"
+    value = lookup_key_write(args[1])
+    if value is WRONGTYPE:
+        return value
+    value = value or b""
+    # Values stay immutable bytes: queued replies may still reference them
+    value += args[2]
+    set_string(args[1], value, keep_ttl=True)
+    return b":%d\r\n" % len(value)
+
+
+def execute_strlen_command(args):
+    if len(args) != 2:
+        return b"-ERR wrong number of arguments\r\n"
+    value = lookup_key_read(args[1])
+    if value is WRONGTYPE:
+        return value
+    return b":%d\r\n" % (0 if value is None else len(value))
+
+
+def execute_getrange_command(args):
+    if len(args) != 4:
+        return b"-ERR wrong number of arguments\r\n"
+    start = parse_int(args[2])
+    end = parse_int(args[3])
+    if start is None or end is None:
+        return b"-ERR value is not an integer or out of range\r\n"
+    value = lookup_key_read(args[1])
+    if value is WRONGTYPE:
+        return value
+    value = value or b""
+    length = len(value)
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = max(length + end, 0)
+    end = min(end, length - 1)
+    if start > end or length == 0:
+        return b"$0\r\n\r\n"
+    return string(value[start:end + 1])
+
+
+def execute_setrange_command(args):
+    if len(args) != 4:
+        return b"-ERR wrong number of arguments\r\n"
+    offset = parse_int(args[2])
+    if offset is None or offset < 0:
+        return b"-ERR offset is out of range\r\n"
+    patch = args[3]
+    value = lookup_key_write(args[1])
+    if value is WRONGTYPE:
+        return value
+    if not patch:
+        return b":%d\r\n" % (0 if value is None else len(value))
+    if offset + len(patch) > 512 * 1024 * 1024:
+        return b"-ERR string exceeds maximum allowed size (proto-max-bulk-len)\r\n"
+    value = (value or b"").ljust(offset, b"\x00")
+    value = value[:offset] + patch + value[offset + len(patch):]
+    set_string(args[1], value, keep_ttl=True)
+    return b":%d\r\n" % len(value)
+
+
+def execute_expire_command(args, unit=b"EX"):
+    if len(args) < 3:
+        return b"-ERR wrong number of arguments\r\n"
+    key = args[1]
+    amount = parse_int(args[2])
+    if amount is None:
+        return b"-ERR value is not an integer or out of range\r\n"
+    condition = args[3].upper() if len(args) == 4 else None
+    if len(args) > 4 or condition not in (None, b"NX", b"XX", b"GT", b"LT"):
+        return b"-ERR syntax error\r\n"
+
+    if not key_exists(key):
+        return b":0\r\n"
+    when = time.time() + (amount if unit == b"EX" else amount / 1000)
+    current = expiration_times.get(key)
+    if condition == b"NX" and current is not None:
+        return b":0\r\n"
+    if condition == b"XX" and current is None:
+        return b":0\r\n"
+    # A key without a TTL counts as an infinite one for GT/LT
+    if condition == b"GT" and (current is None or when <= current):
+        return b":0\r\n"
+    if condition == b"LT" and current is not None and when >= current:
+        return b":0\r\n"
+    set_expire(key, when)
     return b":1\r\n"
 
+
+def execute_pexpire_command(args):
+    return execute_expire_command(args, b"PX")
+
+
+def execute_ttl_command(args, unit=b"EX"):
+    if len(args) != 2:
+        return b"-ERR wrong number of arguments\r\n"
+    key = args[1]
+    expire_if_needed(key)
+    track_key(key)
+    if not key_exists(key):
+        return b":-2\r\n"
+    if key not in expiration_times:
+        return b":-1\r\n"
+    remaining_ms = max(int((expiration_times[key] - time.time()) * 1000), 0)
+    if unit == b"EX":
+        return b":%d\r\n" % ((remaining_ms + 500) // 1000)
+    return b":%d\r\n" % remaining_ms
+
+
+def execute_pttl_command(args):
+    return execute_ttl_command(args, b"PX")
+
+
+def execute_persist_command(args):
+    if len(args) != 2:
+        return b"-ERR wrong number of arguments\r\n"
+    if key_exists(args[1]) and remove_expire(args[1]):
+        return b":1\r\n"
+    return b":0\r\n"
+
+
+# Commands that take the parsed argument list, dispatched by exact name
+command_table = {
+    b"DEL": execute_del_command,
+    b"UNLINK": execute_unlink_command,
+    b"FLUSHDB": execute_flush_command,
+    b"FLUSHALL": execute_flush_command,
+    b"SET": execute_set_command,
+    b"GET": execute_get_command,
+    b"MGET": execute_mget_command,
+    b"MSET": execute_mset_command,
+    b"MSETNX": execute_msetnx_command,
+    b"GETEX": execute_getex_command,
+    b"GETDEL": execute_getdel_command,
+    b"INCR": execute_incr_command,
+    b"DECR": execute_decr_command,
+    b"INCRBY": execute_incrby_command,
+    b"DECRBY": execute_decrby_command,
+    b"INCRBYFLOAT": execute_incrbyfloat_command,
+    b"APPEND": execute_append_command,
+    b"STRLEN": execute_strlen_command,
+    b"GETRANGE": execute_getrange_command,
+    b"SETRANGE": execute_setrange_command,
+    b"EXPIRE": execute_expire_command,
+    b"PEXPIRE": execute_pexpire_command,
+    b"TTL": execute_ttl_command,
+    b"PTTL": execute_pttl_command,
+    b"PERSIST": execute_persist_command,
+}
+
+
 def execute_type_command(data):
     split = data.split(b"\r\n")
     key = split[4]
-    if key in expiration_times and time.time() >= expiration_times[key]:
-        del dictionary[key]
-        del expiration_times[key]
+    expire_if_needed(key)
+    track_key(key)
     if key in streams:
         return b'+stream\r\n'
     elif key in dictionary:
@@ -442,11 +1363,13 @@ def execute_RPUSH_command(data):
     split = data.split(b"\r\n")
     key = split[4]
     values = [split[i] for i in range(6, len(split) - 1, 2)]
+    expire_if_needed(key)
     if key in lists:
         lists[key].extend(values)
     else:
         lists[key] = values
     length = len(lists[key])
+    invalidate_key(key)
     notify_blpop_clients(key)
     return b":" + str(length).encode() + b"\r\n"
 
@@ -455,11 +1378,13 @@ def execute_LPUSH_command(data):
     split = data.split(b"\r\n")
     key = split[4]
     values = [split[i] for i in range(6, len(split) - 1, 2)]
+    expire_if_needed(key)
     if key in lists:
         lists[key] = list(reversed(values)) + lists[key]
     else:
         lists[key] = list(reversed(values))
     length = len(lists[key])
+    invalidate_key(key)
     notify_blpop_clients(key)
     return b":" + str(length).encode() + b"\r\n"
 
@@ -469,6 +1394,8 @@ def execute_LRANGE_command(data):
     key = split[4]
     start = int(split[6])
     end = int(split[8])
+    expire_if_needed(key)
+    track_key(key)
     if key not in lists:
         return b"*0\r\n"
     values = lists[key]
@@ -482,8 +1409,10 @@ def execute_LRANGE_command(data):
     if start > end or start >= len(values):
         return b"*0\r\n"
 
-    result = values[start:end + 1]
-    return b"*" + str(len(result)).encode() + b"\r\n" + b"".join(string(v) for v in result)
+    reply = Reply().array(end - start + 1)
+    for i in range(start, end + 1):
+        reply.bulk(values[i])
+    return reply
     # if key in lists:
     #     values = lists[key][start:end + 1]
     #     return b"*" + str(len(values)).encode() + b"\r\n" + b"".join(string(v) for v in values)
@@ -492,6 +1421,8 @@ def execute_LRANGE_command(data):
 def execute_LLEN_command(data):
     split = data.split(b"\r\n")
     key = split[4]
+    expire_if_needed(key)
+    track_key(key)
     if key not in lists:
         return b":0\r\n"
     length = len(lists[key])
@@ -507,30 +1438,31 @@ def execute_LPOP_command(data):
             count = int(split[6])
         except (ValueError, IndexError):
             count = 1
+    if count < 0:
+        return b"-ERR value is out of range, must be positive\r\n"
     
+    expire_if_needed(key)
     if key not in lists or len(lists[key]) == 0:
         return b"$-1\r\n"
     
+    invalidate_key(key)
     if count == 1:
         popped = lists[key].pop(0)
         return string(popped)
     
-    popped_items = []
     min_count = min(count, len(lists[key]))
-    for _ in range(min_count):
-        popped_items.append(lists[key].pop(0))
-    result = f"*{len(popped_items)}\r\n".encode() 
-    for i in popped_items:
-        result += string(i)
-    return result
+    popped_items = lists[key][:min_count]
+    del lists[key][:min_count]
+    reply = Reply().array(len(popped_items))
+    for item in popped_items:
+        reply.bulk(item)
+    return reply
 
 def execute_config_get_command(data):
     split = data.split(b"\r\n")
     param = split[6]
-    if param == b'dir':
-        value = config['dir'].encode()
-    elif param == b'dbfilename':
-        value = config['dbfilename'].encode()
+    if param.decode() in config:
+        value = str(config[param.decode()]).encode()
     else:
         return b"*0\r\n"
     result = b"*2\r\n" + string(param) + string(value)
@@ -550,8 +1482,10 @@ def execute_BLPOP_command(data, conn):
             timeout = 0.0  # treat bad input like 0 (block forever)
 
     # immediate reply if item exists
+    expire_if_needed(key)
     if key in lists and len(lists[key]) > 0:
         value = lists[key].pop(0)
+        invalidate_key(key)
         return b"*2\r\n" + string(key) + string(value)
 
     # otherwise block; 0 -> forever
@@ -586,10 +1520,7 @@ def check_blocked_timeouts():
     expired_clients = []
     for conn, (expire_time, stream_keys, resolved_ids) in blocking_clients.items():
         if current_time >= expire_time:
-            try:
-                conn.sendall(b"*-1\r\n")
-            except:
-                pass  # Connection might be closed
+            queue_reply(conn, b"*-1\r\n")
             expired_clients.append(conn)
     for conn in expired_clients:
         blocking_clients.pop(conn, None)
@@ -598,149 +1529,242 @@ def check_blocked_timeouts():
     expired_bl = []
     for conn, info in list(list_blocking_clients.items()):
         if time.time() >= info.get('expire_time', float('inf')):
-            try:
-                conn.sendall(b"*-1\r\n")  # RESP null array
-            except:
-                pass
+            queue_reply(conn, b"*-1\r\n")  # RESP null array
             expired_bl.append(conn)
     for conn in expired_bl:
         list_blocking_clients.pop(conn, None)
 
 
 
-def read(conn):
-    global dictionary, streams, lists
+def close_client(conn):
+    sel.unregister(conn)
+    conn.close()
+    transactions.pop(conn, None)
+    blocking_clients.pop(conn, None)
+    list_blocking_clients.pop(conn, None)
+    disable_tracking(conn)
+    client_protocol.pop(conn, None)
+    clients_by_id.pop(client_ids.pop(conn, None), None)
+    request_readers.pop(conn, None)
+    pending_output.pop(conn, None)
+    clients_pending_write.discard(conn)
+
+
+def read_request(conn):
+    """Receive and parse requests; safe to run on an I/O thread.
+
+    Returns the list of complete (data, cmd, args) commands received so far,
+    or None when the client has gone away or sent a malformed request.
+    """
     try:
-        data = conn.recv(1024)
-        if not data:
-            sel.unregister(conn)
-            conn.close()
-            transactions.pop(conn, None)
-            blocking_clients.pop(conn, None)
-            list_blocking_clients.pop(conn, None)
-
-            return
-    except:
-        sel.unregister(conn)
-        conn.close()
-        transactions.pop(conn, None)
-        blocking_clients.pop(conn, None)
-        list_blocking_clients.pop(conn, None)
+        data = conn.recv(65536)
+    except OSError:
+        return None
+    if not data:
+        return None
+    try:
+        return request_readers[conn].feed(data)
+    except ValueError:
+        return None
+
+
+def write_job(conn):
+    try:
+        return write_pending(conn)
+    except OSError:
+        return None
+
+
+def execute_requests(conn, requests):
+    """Run a client's pipelined commands, queueing each reply as it is made.
+
+    Queueing per command keeps replies and invalidation pushes caused by
+    later commands in the order they happened.
+    """
+    for request in requests:
+        queue_reply(conn, execute_command(conn, *request))
 
+
+def read(conn):
+    requests = read_request(conn)
+    if requests is None:
+        close_client(conn)
+        return
+    execute_requests(conn, requests)
+
+
+def use_io_threads(conns):
+    # Like Redis, skip the hand-off when there is too little work to share
+    return io_pool is not None and len(conns) >= 2 * config['io-threads']
+
+
+def run_shard(job, conns):
+    return [(conn, job(conn)) for conn in conns]
+
+
+def run_on_io_threads(job, conns):
+    """Run job(conn) for every client, one batch per I/O thread.
+
+    A client always lands in the same batch (client id modulo io-threads);
+    the main thread works through batch 0 itself while the pool does the rest.
+    """
+    count = config['io-threads']
+    shards = [[] for _ in range(count)]
+    for conn in conns:
+        shards[client_ids[conn] % count].append(conn)
+    futures = [io_pool.submit(run_shard, job, shard) for shard in shards[1:] if shard]
+    results = run_shard(job, shards[0])
+    for future in futures:
+        results += future.result()
+    return results
+
+
+def handle_readable(conns):
+    """Serve a batch of readable clients, Redis 6 io-threads style.
+
+    Reads/parsing and reply writes fan out over the I/O threads, while
+    commands run one at a time on the main thread so the keyspace is never
+    shared.
+    """
+    if not use_io_threads(conns):
+        for conn in conns:
+            read(conn)
+        return
+
+    for conn, requests in run_on_io_threads(read_request, conns):
+        if requests is None:
+            close_client(conn)
+            continue
+        execute_requests(conn, requests)
+
+
+def handle_pending_writes():
+    """Flush every client that got new output during this iteration."""
+    conns = list(clients_pending_write)
+    clients_pending_write.clear()
+    if not use_io_threads(conns):
+        for conn in conns:
+            flush_output(conn)
         return
 
-    cmd = data.upper()
+    for conn, done in run_on_io_threads(write_job, conns):
+        if done is None:
+            close_client(conn)
+        else:
+            finish_write(conn, done)
+
 
-    if b"PING" in cmd:
-        conn.sendall(b"+PONG\r\n")
+def execute_command(conn, data, cmd, args):
+    global dictionary, streams, lists, current_client
+    current_client = conn
+    name = args[0].upper() if args else b""
+
+    if name == b"HELLO":
+        return execute_hello_command(args, conn)
+    elif name == b"CLIENT":
+        return execute_client_command(args, conn)
+    elif name in command_table:
+        if is_in_multi(conn):
+            enqueue(conn, name, args)
+            return b"+QUEUED\r\n"
+        return command_table[name](args)
+    elif b"PING" in cmd:
+        return b"+PONG\r\n"
     elif b"KEYS" in cmd:
-        conn.sendall(execute_keys_command(data))
+        return execute_keys_command(data)
     elif b"CONFIG" in cmd and b"GET" in cmd:
-        conn.sendall(execute_config_get_command(data))
-    elif b"SET" in cmd:
-        if is_in_multi(conn):
-            enqueue(conn, 'SET', data)
-            conn.sendall(b"+QUEUED\r\n")
-        else:
-            conn.sendall(execute_set_command(data))
+        return execute_config_get_command(data)
     elif b"SUBSCRIBE" in cmd:
-        conn.sendall(execute_SUBSCRIBE_command(data, conn))
-    elif b"GET" in cmd:
-        if is_in_multi(conn):
-            enqueue(conn, 'GET', data)
-            conn.sendall(b"+QUEUED\r\n")
-        else:
-            conn.sendall(execute_get_command(data))
+        return execute_SUBSCRIBE_command(data, conn)
     elif b"BLPOP" in cmd:
         if is_in_multi(conn):
             enqueue(conn, 'BLPOP', data)
-            conn.sendall(b"+QUEUED\r\n")
+            return b"+QUEUED\r\n"
         else:
-            resp = execute_BLPOP_command(data, conn)
-            if resp:
-                conn.sendall(resp)
+            return execute_BLPOP_command(data, conn)
     elif b"LRANGE" in cmd:
         if is_in_multi(conn):
             enqueue(conn, 'LRANGE', data)
-            conn.sendall(b"+QUEUED\r\n")
+            return b"+QUEUED\r\n"
         else:
-            conn.sendall(execute_LRANGE_command(data))
+            return execute_LRANGE_command(data)
     elif b"LLEN" in cmd:
         if is_in_multi(conn):
             enqueue(conn, 'LLEN', data)
-            conn.sendall(b"+QUEUED\r\n")
+            return b"+QUEUED\r\n"
         else:
-            conn.sendall(execute_LLEN_command(data))
+            return execute_LLEN_command(data)
     elif b"LPOP" in cmd:
         if is_in_multi(conn):
             enqueue(conn, 'LPOP', data)
-            conn.sendall(b"+QUEUED\r\n")
+            return b"+QUEUED\r\n"
         else:
-            conn.sendall(execute_LPOP_command(data))
+            return execute_LPOP_command(data)
     elif b"LPUSH" in cmd:
         if is_in_multi(conn):
             enqueue(conn, 'LPUSH', data)
-            conn.sendall(b"+QUEUED\r\n")
-        else:
-            conn.sendall(execute_LPUSH_command(data))
-    elif b"INCR" in cmd:
-        if is_in_multi(conn):
-            enqueue(conn, 'INCR', data)
-            conn.sendall(b"+QUEUED\r\n")
+            return b"+QUEUED\r\n"
         else:
-            conn.sendall(execute_incr_command(data))
+            return execute_LPUSH_command(data)
     elif b"RPUSH" in cmd:
         if is_in_multi(conn):
             enqueue(conn, 'RPUSH', data)
-            conn.sendall(b"+QUEUED\r\n")
+            return b"+QUEUED\r\n"
         else:
-            conn.sendall(execute_RPUSH_command(data))
+            return execute_RPUSH_command(data)
     elif b"TYPE" in cmd:
         if is_in_multi(conn):
             enqueue(conn, 'TYPE', data)
-            conn.sendall(b"+QUEUED\r\n")
+            return b"+QUEUED\r\n"
         else:
-            conn.sendall(execute_type_command(data))
+            return execute_type_command(data)
     elif b"XREAD" in cmd:
-        resp = execute_xread_command(data, conn)
-        if resp:
-            conn.sendall(resp)
+        return execute_xread_command(data, conn)
     elif b"XADD" in cmd:
-        conn.sendall(execute_xadd_command(data))
+        return execute_xadd_command(data)
     elif b"XRANGE" in cmd:
-        conn.sendall(execute_xrange_command(data))
+        return execute_xrange_command(data)
     elif b"MULTI" in cmd:
         transactions[conn] = {"in_multi": True, "queue": []}
-        conn.sendall(b"+OK\r\n")
+        return b"+OK\r\n"
     elif b"DISCARD" in cmd:
         if is_in_multi(conn):
             transactions.pop(conn, None)
-            conn.sendall(b"+OK\r\n")
+            return b"+OK\r\n"
         else:
-            conn.sendall(b"-ERR DISCARD without MULTI\r\n")
+            return b"-ERR DISCARD without MULTI\r\n"
     elif b"EXEC" in cmd:
         if not is_in_multi(conn):
-            conn.sendall(b"-ERR EXEC without MULTI\r\n")
+            return b"-ERR EXEC without MULTI\r\n"
         else:
             responses = []
             for command_type, command_data in transactions[conn]["queue"]:
-                if command_type == 'SET':
-                    responses.append(execute_set_command(command_data))
-                elif command_type == 'GET':
-                    responses.append(execute_get_command(command_data))
-                elif command_type == 'INCR':
-                    responses.append(execute_incr_command(command_data))
+                if command_type in command_table:
+                    responses.append(command_table[command_type](command_data))
                 elif command_type == 'TYPE':
                     responses.append(execute_type_command(command_data))
-            result = b"*" + str(len(responses)).encode() + b"\r\n" + b"".join(responses)
-            conn.sendall(result)
+            reply = Reply().array(len(responses))
+            for response in responses:
+                reply.extend(response)
             transactions.pop(conn, None)
+            return reply
     else:
         temp = parsing(data)
         if temp:
-            conn.sendall(string(temp))
+            return string(temp)
         else:
-            conn.sendall(b"-ERR unknown command\r\n")
+            return b"-ERR unknown command\r\n"
+
+
+def start_io_threads(count):
+    global io_pool
+    if count > 1:
+        # The main thread is I/O thread 0
+        io_pool = ThreadPoolExecutor(max_workers=count - 1, thread_name_prefix="io")
+
+
+def start_lazyfree_thread():
+    threading.Thread(target=lazyfree_worker, name="lazyfree", daemon=True).start()
 
 
 def main(port=6379):
@@ -748,12 +1772,24 @@ def main(port=6379):
     server_socket = socket.create_server(("localhost", port), reuse_port=True)
     server_socket.setblocking(False)
     sel.register(server_socket, selectors.EVENT_READ, accept)
+    start_io_threads(config['io-threads'])
+    start_lazyfree_thread()
     while True:
         events = sel.select(timeout=0.1)
-        for key, _ in events:
+        readable = []
+        for key, mask in events:
             callback = key.data
-            callback(key.fileobj)
+            if callback is read:
+                if mask & selectors.EVENT_WRITE:
+                    clients_pending_write.add(key.fileobj)
+                if mask & selectors.EVENT_READ:
+                    readable.append(key.fileobj)
+            else:
+                callback(key.fileobj)
+        if readable:
+            handle_readable(readable)
         check_blocked_timeouts()
+        handle_pending_writes()
 
 
 if __name__ == "__main__":
@@ -767,4 +1803,15 @@ if __name__ == "__main__":
     if "--dbfilename" in sys.argv:
         idx = sys.argv.index("--dbfilename")
         config['dbfilename'] = sys.argv[idx + 1]
+    if "--tracking-table-max-keys" in sys.argv:
+        idx = sys.argv.index("--tracking-table-max-keys")
+        config['tracking-table-max-keys'] = int(sys.argv[idx + 1])
+    for option in ('lazyfree-lazy-expire', 'lazyfree-lazy-server-del',
+                   'lazyfree-lazy-user-del', 'lazyfree-lazy-user-flush'):
+        if "--" + option in sys.argv:
+            idx = sys.argv.index("--" + option)
+            config[option] = sys.argv[idx + 1]
+    if "--io-threads" in sys.argv:
+        idx = sys.argv.index("--io-threads")
+        config['io-threads'] = int(sys.argv[idx + 1])
     main(port)
\ No newline at end of file